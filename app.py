@@ -2,8 +2,13 @@ import os
 import re
 import json
 import io
-import tempfile
+import hashlib
+import threading
 import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from types import MappingProxyType
 import streamlit as st
 
 # Optional dependencies: import safely so missing packages don't crash the app at import time.
@@ -24,12 +29,28 @@ try:
 except Exception:
     gTTS = None
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 from datetime import datetime
 
+import lesson_store
+from prompts import LESSON_GENERATION_CONFIG, TEACHER_SYSTEM, build_prompt
+
 # ---------- Setup ----------
-load_dotenv()
-GENAI_API_KEY = os.getenv("GOOGLE_API_KEY")
-HISTORY_FILE = "lessons.json"
+HISTORY_FILE = "lessons.jsonl"
+LEGACY_HISTORY_FILE = "lessons.json"  # read once to seed the log if it doesn't exist yet
+HISTORY_LIMIT = 50  # lessons kept per session (oldest dropped first)
+HISTORY_PAGE = 10  # lessons rendered per page of the history panel
+GENAI_TIMEOUT = 30  # seconds before a Gemini request is abandoned
+LESSON_WAIT_SECONDS = 300  # longest a session waits on another session generating the same lesson
+GENAI_MODEL = "gemini-2.0-flash"
+TTS_WORKERS = 8  # concurrent gTTS requests per narration
+AUDIO_WORKERS = 4  # narrations synthesized in the background at once, across all sessions
+AUDIO_POLL_SECONDS = 1  # how often the audio tab checks on a background narration
+PREVIEW_SECONDS = 0.1  # minimum gap between redraws of the streaming explanation preview
 
 st.set_page_config(
     page_title="AI Science Explainer",
@@ -40,134 +61,212 @@ st.set_page_config(
 st.title("🧠 AI Science Explainer — Robust Learning Edition")
 
 # ---------- Persistence Utilities ----------
+# History is an append-only JSON Lines log: a new lesson appends one line, and the
+# file is only rewritten (compacted) on delete, clear or an explicit save.
+def dump_record(record):
+    """Serialize one lesson as a single line of JSON."""
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record).encode("utf-8") + b"\n"
+
 def save_history_to_file(history):
-    """Save user lesson history to local JSON file."""
+    """Rewrite the history log with exactly these lessons."""
     try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
+        # Write then rename so an interrupted save never leaves a truncated file
+        tmp_file = f"{HISTORY_FILE}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(b"".join(dump_record(lesson) for lesson in history))
+        os.replace(tmp_file, HISTORY_FILE)
         return True
     except Exception as e:
         # Polished Error Message
         st.error(f"Persistence Error: Could not save history data. Details: {e}")
         return False
 
+def append_history_record(lesson):
+    """Append one lesson to the history log without rewriting it."""
+    try:
+        with open(HISTORY_FILE, "ab") as f:
+            f.write(dump_record(lesson))
+        return True
+    except Exception as e:
+        st.error(f"Persistence Error: Could not save history data. Details: {e}")
+        return False
+
 def load_history_from_file():
-    """Load user lesson history if it exists."""
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            # Polished Error Message
-            st.error(f"Persistence Error: Could not load history data. Details: {e}")
-            return []
-    return []
+    """Load user lesson history if it exists, and whether the log needs rewriting."""
+    loads = orjson.loads if orjson is not None else json.loads
+    try:
+        if os.path.exists(HISTORY_FILE):
+            records = []
+            truncated = False
+            with open(HISTORY_FILE, "rb") as f:
+                for line in f:
+                    try:
+                        records.append(loads(line))
+                    except ValueError:
+                        truncated = True  # A line cut short by an interrupted append
+            return records, truncated
+        if os.path.exists(LEGACY_HISTORY_FILE):
+            with open(LEGACY_HISTORY_FILE, "rb") as f:
+                return loads(f.read()), True  # Seeds the log on first run
+    except Exception as e:
+        # Polished Error Message
+        st.error(f"Persistence Error: Could not load history data. Details: {e}")
+    return [], False
+
+def compact_history(drop=()):
+    """Rewrite the log from this session's lessons, keeping saved ones it doesn't hold."""
+    # The session only holds the latest HISTORY_LIMIT lessons; older ones stay on disk
+    older = {}
+    for lesson in load_history_from_file()[0]:
+        key = history_key(lesson)
+        if key not in st.session_state.lessons and key not in drop:
+            older.pop(key, None)
+            older[key] = lesson
+    return save_history_to_file([*older.values(), *history_lessons()])
+
+# ---------- Response Patterns ----------
+# Compiled once at import; the parser runs on every uncached Gemini response.
+# Section headers of the plain-text format, e.g. "EXPLANATION:" or "**2. ENGAGING FUN FACTS**";
+# located in one pass so each section is sliced out rather than searched for.
+SECTION_RE = re.compile(
+    r"^[ \t*#]*(?:\d[.)][ \t]*)?(?:(?:CLEAR|ENGAGING|INTERACTIVE)[ \t]+)?"
+    r"(EXPLANATION|FUN[ \t]+FACTS?|QUIZ)(?:[ \t]+QUESTIONS)?[ \t]*(?:\([^)\n]*\))?"
+    r"[ \t]*(?::\**|\**[ \t]*$)",
+    re.M | re.I
+)
+# One fact per bulleted or numbered line; anchoring to the line start keeps
+# hyphens inside a sentence ("non-stop") from being read as bullets.
+FACT_LINE_RE = re.compile(r"^[ \t]*(?:[-•*]|\d+[.)])[ \t]+(.+?)\s*$", re.M)
+QUESTION_ANCHOR_RE = re.compile(r"^[\s*#]*(?:Question\s*\d+|Q\d+|\d+)\s*[:.)]", re.M | re.I)
+# Captures the label with the text so options keep it without being re-prefixed
+OPTION_RE = re.compile(r"([A-D])\)\s*([^\n]+)")
+OPTION_LABEL_RE = re.compile(r"^\(?[A-Da-d][).:]\s*")
+# Labels for the four option slots, so relabeling or padding options doesn't rebuild them
+_OPT_PREFIXES = ("A) ", "B) ", "C) ", "D) ")
+ANSWER_RE = re.compile(r"Answer\s*:?\**\s*\(?([A-D])\b", re.I)
+# Text between full stops, for key takeaways
+SENTENCE_RE = re.compile(r"[^.]+")
+# Sentence boundaries the narration is split on for concurrent synthesis
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+# Explanation value of a possibly incomplete JSON lesson, for the streaming preview
+JSON_EXPLANATION_RE = re.compile(r'"explanation"\s*:\s*"((?:[^"\\]|\\.)*)')
 
 # ---------- Quiz Generator ----------
+# Built once at import with {topic} placeholders; only the requested level is formatted per call.
+# Read-only all the way down (tuples and mapping proxies), since every fallback
+# quiz is formatted from this one shared table.
+QUIZ_TEMPLATES = MappingProxyType({
+    "Beginner": (
+        MappingProxyType({
+            "question": "What is the main concept of {topic}?",
+            "options": (
+                "A) A basic process in {topic}", 
+                "B) A complex theory about {topic}", 
+                "C) A simple fact about {topic}", 
+                "D) A measurement of {topic}"
+            ),
+            "answer": "A"
+        }),
+        MappingProxyType({
+            "question": "How is {topic} important in everyday life?",
+            "options": (
+                "A) It affects daily activities", 
+                "B) It has no practical use", 
+                "C) It's only theoretical", 
+                "D) It's too complex for daily use"
+            ),
+            "answer": "A"
+        }),
+        MappingProxyType({
+            "question": "What would happen if {topic} didn't exist?",
+            "options": (
+                "A) Nothing significant", 
+                "B) Major changes in our world", 
+                "C) Only minor effects", 
+                "D) Unknown consequences"
+            ),
+            "answer": "B"
+        })
+    ),
+    "Intermediate": (
+        MappingProxyType({
+            "question": "What is the underlying mechanism of {topic}?",
+            "options": (
+                "A) Simple cause and effect", 
+                "B) Complex interactions between components", 
+                "C) Random processes", 
+                "D) Pure speculation"
+            ),
+            "answer": "B"
+        }),
+        MappingProxyType({
+            "question": "Which scientific field best describes {topic}?",
+            "options": (
+                "A) Physics", 
+                "B) Chemistry", 
+                "C) Biology", 
+                "D) It spans multiple fields"
+            ),
+            "answer": "D"
+        }),
+        MappingProxyType({
+            "question": "What evidence supports our understanding of {topic}?",
+            "options": (
+                "A) Theoretical models", 
+                "B) Experimental data", 
+                "C) Mathematical proof", 
+                "D) All of the above"
+            ),
+            "answer": "D"
+        })
+    ),
+    "Advanced": (
+        MappingProxyType({
+            "question": "What are the mathematical models used to describe {topic}?",
+            "options": (
+                "A) Linear equations", 
+                "B) Differential equations", 
+                "C) Statistical models", 
+                "D) Complex computational models"
+            ),
+            "answer": "D"
+        }),
+        MappingProxyType({
+            "question": "How does {topic} relate to fundamental physics principles?",
+            "options": (
+                "A) It's unrelated", 
+                "B) It follows standard physical laws", 
+                "C) It challenges current understanding", 
+                "D) It's purely philosophical"
+            ),
+            "answer": "B"
+        }),
+        MappingProxyType({
+            "question": "What are the current research frontiers in {topic}?",
+            "options": (
+                "A) Established knowledge", 
+                "B) Active investigation", 
+                "C) Speculative theories", 
+                "D) Unknown territory"
+            ),
+            "answer": "B"
+        })
+    )
+})
+
 def generate_topic_specific_quiz(topic, level, explanation_text=""):
     """Generates predefined, level-specific quiz questions for local fallback."""
-    
-    # Dynamic question templates based on level
-    level_templates = {
-        "Beginner": [
-            {
-                "question": f"What is the main concept of {topic}?",
-                "options": [
-                    f"A) A basic process in {topic}", 
-                    f"B) A complex theory about {topic}", 
-                    f"C) A simple fact about {topic}", 
-                    f"D) A measurement of {topic}"
-                ],
-                "answer": "A"
-            },
-            {
-                "question": f"How is {topic} important in everyday life?",
-                "options": [
-                    f"A) It affects daily activities", 
-                    f"B) It has no practical use", 
-                    f"C) It's only theoretical", 
-                    f"D) It's too complex for daily use"
-                ],
-                "answer": "A"
-            },
-            {
-                "question": f"What would happen if {topic} didn't exist?",
-                "options": [
-                    f"A) Nothing significant", 
-                    f"B) Major changes in our world", 
-                    f"C) Only minor effects", 
-                    f"D) Unknown consequences"
-                ],
-                "answer": "B"
-            }
-        ],
-        "Intermediate": [
-            {
-                "question": f"What is the underlying mechanism of {topic}?",
-                "options": [
-                    f"A) Simple cause and effect", 
-                    f"B) Complex interactions between components", 
-                    f"C) Random processes", 
-                    f"D) Pure speculation"
-                ],
-                "answer": "B"
-            },
-            {
-                "question": f"Which scientific field best describes {topic}?",
-                "options": [
-                    "A) Physics", 
-                    "B) Chemistry", 
-                    "C) Biology", 
-                    "D) It spans multiple fields"
-                ],
-                "answer": "D"
-            },
-            {
-                "question": f"What evidence supports our understanding of {topic}?",
-                "options": [
-                    "A) Theoretical models", 
-                    "B) Experimental data", 
-                    "C) Mathematical proof", 
-                    "D) All of the above"
-                ],
-                "answer": "D"
-            }
-        ],
-        "Advanced": [
-            {
-                "question": f"What are the mathematical models used to describe {topic}?",
-                "options": [
-                    "A) Linear equations", 
-                    "B) Differential equations", 
-                    "C) Statistical models", 
-                    "D) Complex computational models"
-                ],
-                "answer": "D"
-            },
-            {
-                "question": f"How does {topic} relate to fundamental physics principles?",
-                "options": [
-                    "A) It's unrelated", 
-                    "B) It follows standard physical laws", 
-                    "C) It challenges current understanding", 
-                    "D) It's purely philosophical"
-                ],
-                "answer": "B"
-            },
-            {
-                "question": f"What are the current research frontiers in {topic}?",
-                "options": [
-                    "A) Established knowledge", 
-                    "B) Active investigation", 
-                    "C) Speculative theories", 
-                    "D) Unknown territory"
-                ],
-                "answer": "B"
-            }
-        ]
-    }
-    
-    return level_templates.get(level, level_templates["Beginner"])
+    templates = QUIZ_TEMPLATES.get(level, QUIZ_TEMPLATES["Beginner"])
+    return [
+        {
+            "question": t["question"].format(topic=topic),
+            "options": [opt.format(topic=topic) for opt in t["options"]],
+            "answer": t["answer"]
+        }
+        for t in templates
+    ]
 
 # ---------- API Configuration ----------
 @st.cache_resource(show_spinner="🔧 Initializing AI services...")
@@ -176,104 +275,245 @@ def init_gemini():
     if genai is None:
         return None, "❌ google-generativeai package not installed"
 
-    if not GENAI_API_KEY:
+    # Read the key here rather than at module level so reruns don't re-parse .env
+    load_dotenv()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
         return None, "❌ Missing GOOGLE_API_KEY in .env"
     try:
-        genai.configure(api_key=GENAI_API_KEY)
-        model = genai.GenerativeModel("gemini-2.0-flash")
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(GENAI_MODEL, system_instruction=TEACHER_SYSTEM)
         return model, "✅ AI Ready"
     except Exception as e:
         return None, f"❌ Failed to initialize: {str(e)}"
 
 # ---------- Core Functions ----------
-@st.cache_data(show_spinner="🤖 Generating explanation...")
-def generate_explanation(topic, level):
-    """Generate comprehensive science explanation with guaranteed quiz."""
-    level_contexts = {
-        "Beginner": "simple language, basic concepts, everyday examples",
-        "Intermediate": "moderate complexity, scientific terminology, practical applications",
-        "Advanced": "detailed explanations, complex concepts, technical precision"
+def stream_explanation(topic, level):
+    """Yield Gemini lesson text chunk by chunk as it is generated."""
+    # The SDK timeout aborts a stalled request instead of waiting it out.
+    response = MODEL.generate_content(
+        build_prompt(topic, level),
+        generation_config=LESSON_GENERATION_CONFIG,
+        stream=True,
+        request_options={"timeout": GENAI_TIMEOUT}
+    )
+    empty = True
+    for chunk in response:
+        text = chunk_text(chunk)
+        if text:
+            empty = False
+            yield text
+    if empty:
+        raise ValueError("no text in response")
+
+def chunk_text(chunk):
+    """Pull the text out of a response chunk without formatting the whole proto."""
+    try:
+        return chunk.text
+    except (AttributeError, ValueError):
+        pass  # .text raises when a chunk has no plain text part, e.g. a safety stop
+    for candidate in getattr(chunk, "candidates", ()):
+        for part in getattr(getattr(candidate, "content", None), "parts", ()):
+            if getattr(part, "text", None):
+                return part.text
+    return ""
+
+def lesson_timestamps(now=None):
+    """Timestamp a new lesson, formatting its display strings once rather than on every render."""
+    now = now or datetime.now()
+    return {
+        "timestamp": now.isoformat(),
+        "timestamp_display": now.strftime('%b %d, %Y at %I:%M %p'),
+        "timestamp_hm": now.strftime('%H:%M %p')
     }
-    context = level_contexts.get(level, level_contexts["Beginner"])
+
+def fallback_lesson(topic, level):
+    """Build a locally generated lesson for when the AI call fails."""
+    explanation = f"{topic} is an important scientific concept. It involves various processes and mechanisms that are fundamental to understanding our world. The applications of {topic} are found throughout nature and technology, making it essential for scientific literacy."
     
-    prompt = f"""
-You are a patient, engaging science teacher explaining the topic '{topic}' for a {level} learner.
+    return {
+        "explanation": explanation,
+        "fun_facts": [
+            f"Many scientists study {topic} extensively.", 
+            f"{topic} has practical applications in daily life."
+        ],
+        "quizzes": complete_quiz([], topic, level),
+        "topic": topic,
+        "level": level,
+        **lesson_timestamps(),
+        "word_count": len(explanation.split()),
+        "key_points": extract_key_points(explanation),
+        "ai_generated": False
+    }
+
+# lesson_store already keeps lessons across restarts; this bounds the in-memory layer.
+@st.cache_data(ttl=lesson_store.STORE_TTL, max_entries=512, show_spinner=False)
+def generate_explanation(key, level, _text=None, _topic=None):
+    """Cache the parsed lesson for (topic key, level) once its stream has completed."""
+    # `_text` and `_topic` are left out of the cache key: calling without `_text` only
+    # serves hits, and `_topic` is the topic as typed, for the lesson's own wording.
+    if _text is None:
+        raise LookupError(f"No cached lesson for {key} ({level})")
+    return parse_lesson(_text, _topic or key, level)
+
+def topic_key(topic):
+    """Fold a topic for cache and history keys, so casing variants share an entry."""
+    return topic.strip().lower()
 
-Please provide:
-1. CLEAR EXPLANATION (200-300 words): use {context}, give one real-world example.
-2. ENGAGING FUN FACTS (exactly 2)
-3. INTERACTIVE QUIZ (exactly 3 questions): multiple choice A-D, with answer letters.
+@st.cache_resource
+def inflight_lessons():
+    """Share one registry of lessons being generated across every session."""
+    return threading.Lock(), {}
 
-Format with clear headers: EXPLANATION, FUN FACTS, QUIZ QUESTIONS.
-"""
+def fetch_lesson(topic, level, placeholder=None):
+    """Return the cached lesson, streaming a fresh one from Gemini on a miss."""
+    # Cached and coalesced under topic_key() so casing variants share one entry;
+    # Gemini and the lesson text get the topic as typed.
+    lesson = _fetch_lesson(topic, level, placeholder)
+    lesson["topic"] = topic  # Each call gets its own copy, so a hit shows this casing too
+    return lesson
+
+def _fetch_lesson(topic, level, placeholder):
+    key = topic_key(topic)
+    try:
+        return generate_explanation(key, level)
+    except LookupError:
+        pass
+    try:
+        stored = lesson_store.get_response(topic, level)
+    except Exception:
+        stored = None
+    if stored:
+        # Stored by an earlier run or scripts/prewarm.py, no live API call needed
+        return generate_explanation(key, level, _text=stored, _topic=topic)
+
+    # Coalesce concurrent misses: only the first session calls Gemini, the rest wait for it.
+    lock, inflight = inflight_lessons()
+    with lock:
+        entry = inflight.get((key, level))
+        if entry is None:
+            inflight[(key, level)] = {"done": threading.Event(), "failed": False}
+    if entry is not None:
+        if placeholder is not None:
+            placeholder.info("⏳ Another session is generating this lesson, waiting for it...")
+        # GENAI_TIMEOUT only bounds the SDK's I/O, so a whole generation gets a larger bound
+        if not entry["done"].wait(timeout=LESSON_WAIT_SECONDS):
+            return fallback_lesson(topic, level)
+        if entry["failed"]:
+            return stream_lesson(topic, level, placeholder)  # The first request failed
+        try:
+            return generate_explanation(key, level)
+        except LookupError:
+            return stream_lesson(topic, level, placeholder)  # Evicted before we got to it
+    lesson = None
+    try:
+        lesson = stream_lesson(topic, level, placeholder)
+        return lesson
+    finally:
+        with lock:
+            entry = inflight.pop((key, level))
+        entry["failed"] = not (lesson and lesson.get("ai_generated"))
+        entry["done"].set()
+
+def stream_lesson(topic, level, placeholder=None):
+    """Stream a fresh lesson from Gemini, storing and caching it once complete."""
     try:
-        response = MODEL.generate_content(prompt)
-        text = getattr(response, "text", "") or response.candidates[0].content.parts[0].text
+        pieces = []
+        shown = 0.0
+        for piece in stream_explanation(topic, level):
+            pieces.append(piece)
+            # Re-decoding the whole buffer per chunk is quadratic, so redraw at a fixed rate
+            if placeholder is not None and time.monotonic() - shown >= PREVIEW_SECONDS:
+                placeholder.markdown(preview_explanation("".join(pieces)))
+                shown = time.monotonic()
+        text = "".join(pieces)
+    except Exception:
+        # Fallback response when AI fails (not cached, so the next try hits Gemini again)
+        return fallback_lesson(topic, level)
+    try:
+        lesson_store.put_responses([(topic, level, text)])
+    except Exception:
+        pass  # Persisting is best effort; the in-process cache still has the lesson
+    return generate_explanation(topic_key(topic), level, _text=text, _topic=topic)
+
+def preview_explanation(partial_json):
+    """Decode as much of the explanation as has streamed in so far."""
+    match = JSON_EXPLANATION_RE.search(partial_json)
+    if not match:
+        return ""
+    raw = match.group(1)
+    if raw.endswith("\\"):
+        raw = raw[:-1]  # Cut mid-escape; the rest arrives with the next chunk
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+def parse_lesson(text, topic, level):
+    """Build the lesson dict from Gemini's JSON output with guaranteed quiz."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        # Truncated or non-JSON output: salvage what we can from the raw text
         return process_ai_response(text, topic, level)
-    except Exception as e:
-        # Fallback response when AI fails
-        explanation = f"{topic} is an important scientific concept. It involves various processes and mechanisms that are fundamental to understanding our world. The applications of {topic} are found throughout nature and technology, making it essential for scientific literacy."
-        
-        return {
-            "explanation": explanation,
-            "fun_facts": [
-                f"Many scientists study {topic} extensively.", 
-                f"{topic} has practical applications in daily life."
-            ],
-            "quizzes": generate_topic_specific_quiz(topic, level),
-            "topic": topic,
-            "level": level,
-            "timestamp": datetime.now().isoformat(),
-            "word_count": len(explanation.split()),
-            "ai_generated": False
-        }
+    
+    explanation = str(data.get("explanation") or "").strip()
+    if not explanation:
+        explanation = f"{topic} is a fundamental scientific concept that involves important processes and principles. Understanding {topic} helps us better comprehend how the world works and has numerous practical applications in everyday life."
+    
+    facts = pad_facts([fact for fact in (str(f).strip() for f in data.get("fun_facts") or []) if fact], topic)
+    
+    quizzes = []
+    for q in data.get("quizzes") or []:
+        if not isinstance(q, dict):
+            continue
+        options = [str(o).strip() for o in q.get("options") or [] if str(o).strip()]
+        question = str(q.get("question") or "").strip()
+        if not question or len(options) < 3:
+            continue
+        while len(options) < 4:
+            options.append(f"Option {len(options)+1}")
+        # Strip any "A) "-style label the model added so every option is labeled once
+        options = [OPTION_LABEL_RE.sub("", opt, count=1) for opt in options[:4]]
+        answer = str(q.get("answer") or "A").strip().upper()[:1]
+        quizzes.append({
+            "question": question,
+            "options": [prefix + opt for prefix, opt in zip(_OPT_PREFIXES, options)],
+            "answer": answer if answer in "ABCD" else "A"
+        })
+    
+    return {
+        "explanation": explanation,
+        "fun_facts": facts,
+        "quizzes": complete_quiz(quizzes, topic, level),
+        "topic": topic,
+        "level": level,
+        **lesson_timestamps(),
+        "word_count": len(explanation.split()),
+        "key_points": extract_key_points(explanation),
+        "ai_generated": True
+    }
 
 def process_ai_response(text, topic, level):
     """Parse Gemini output into structured data with guaranteed quiz."""
     
-    # Extract explanation
-    exp_patterns = [
-        r"EXPLANATION:?\s*(.*?)(?=FUN FACTS:|QUIZ|$)",
-        r"1\.?\s*CLEAR EXPLANATION.*?(?=2\.|$)",
-        r"EXPLANATION\s*(.*?)(?=\n\n|$)"
-    ]
+    sections = split_sections(text)
     
-    explanation = ""
-    for pattern in exp_patterns:
-        exp_match = re.search(pattern, text, re.S | re.I)
-        if exp_match:
-            explanation = exp_match.group(1).strip()
-            break
+    # Extract explanation
+    explanation = sections.get("EXPLANATION", "").strip()
     
     if not explanation:
         # Fallback explanation
         explanation = f"{topic} is a fundamental scientific concept that involves important processes and principles. Understanding {topic} helps us better comprehend how the world works and has numerous practical applications in everyday life."
     
     # Extract fun facts
-    facts_patterns = [
-        r"FUN FACTS?:?\s*(.*?)(?=QUIZ|$)",
-        r"2\.?\s*ENGAGING FUN FACTS.*?(?=3\.|$)"
-    ]
-    
-    facts = []
-    for pattern in facts_patterns:
-        facts_match = re.search(pattern, text, re.S | re.I)
-        if facts_match:
-            facts_text = facts_match.group(1).strip()
-            extracted_facts = re.findall(r"[-•]\s*(.+)", facts_text)
-            facts.extend(extracted_facts)
-            break
-    
-    if not facts:
-        facts = [
-            f"Research on {topic} continues to reveal new insights.", 
-            f"{topic} plays a crucial role in scientific understanding."
-        ]
-    
-    facts = facts[:2] if len(facts) >= 2 else facts + [f"Interesting fact about {topic}."] * (2 - len(facts))
+    facts = pad_facts([m.group(1) for m in FACT_LINE_RE.finditer(sections.get("FUN", ""))], topic)
     
     # Extract quiz with multiple robust patterns
-    quiz_questions = extract_robust_quiz(text, topic, level)
+    # Without a quiz header, look for questions anywhere in the response
+    quiz_questions = extract_robust_quiz(sections.get("QUIZ", text), topic, level)
     
     return {
         "explanation": explanation,
@@ -281,63 +521,87 @@ def process_ai_response(text, topic, level):
         "quizzes": quiz_questions,
         "topic": topic,
         "level": level,
-        "timestamp": datetime.now().isoformat(),
+        **lesson_timestamps(),
         "word_count": len(explanation.split()),
+        "key_points": extract_key_points(explanation),
         "ai_generated": True
     }
 
-def extract_robust_quiz(text, topic, level):
+def split_sections(text):
+    """Slice a plain-text response into its sections, keyed EXPLANATION, FUN and QUIZ."""
+    headers = list(SECTION_RE.finditer(text))
+    ends = [m.start() for m in headers[1:]] + [len(text)]
+    sections = {}
+    for header, end in zip(headers, ends):
+        sections.setdefault(header.group(1).split()[0].upper(), text[header.end():end])
+    return sections
+
+def extract_robust_quiz(quiz_text, topic, level):
     """Extract quiz with multiple fallback strategies."""
     
-    # Strategy 1: Look for numbered questions
-    quiz_patterns = [
-        r"(?:Question\s*\d*:|Q\d*\.)\s*([^?]*\?)[\s\S]*?(?:A\)|Option\s*A)[\s\S]*?(?:B\)|Option\s*B)[\s\S]*?(?:C\)|Option\s*C)[\s\S]*?(?:D\)|Option\s*D)[\s\S]*?(?:Answer:\s*([A-D]))",
-        r"(\d+\.\s*[^?]*\?)[\s\S]*?A\)\s*([^\n]+)[\s\S]*?B\)\s*([^\n]+)[\s\S]*?C\)\s*([^\n]+)[\s\S]*?D\)\s*([^\n]+)[\s\S]*?(?:Answer:\s*([A-D]))?",
-        r"(?:QUESTION\s*\d*:)\s*([^?]*\?)[\s\S]*?(?:OPTIONS?|CHOICES?)[\s\S]*?(?:A\)[\s\S]*?B\)[\s\S]*?C\)[\s\S]*?D\))"
-    ]
+    # Strategy 1: Slice the quiz section between question anchors in a single
+    # linear pass, then read options and answer from each (short) block.
+    anchors = list(QUESTION_ANCHOR_RE.finditer(quiz_text))
+    block_ends = [m.start() for m in anchors[1:]] + [len(quiz_text)]
     
     extracted_quizzes = []
     
-    for pattern in quiz_patterns:
-        matches = re.findall(pattern, text, re.MULTILINE | re.DOTALL)
-        for match in matches:
-            if len(match) >= 5:  # Need question + 4 options minimum
-                question = match[0].strip() if match[0] else f"Question about {topic}"
-                
-                # Extract options (flexible)
-                full_match = match[0] if isinstance(match[0], str) else " ".join(str(m) for m in match[:4])
-                options = re.findall(r"[A-D]\)\s*([^\n]+)", full_match)
-                
-                if len(options) >= 3:  # Need at least 3 options
-                    # Pad to 4 options
-                    while len(options) < 4:
-                        options.append(f"Option {len(options)+1}")
-                    
-                    # Extract answer
-                    answer = "A"
-                    if len(match) > len(options):
-                        answer_match = match[-1]
-                        if answer_match and answer_match.upper() in "ABCD":
-                            answer = answer_match.upper()
-                    
-                    extracted_quizzes.append({
-                        "question": question,
-                        "options": [f"{chr(65+i)}) {opt.strip()}" for i, opt in enumerate(options[:4])],
-                        "answer": answer
-                    })
+    for anchor, end in zip(anchors, block_ends):
+        if len(extracted_quizzes) == 3:
+            break  # Any extra blocks would be trimmed anyway
+        block = quiz_text[anchor.end():end]
+        options = [f"{letter}) {text.rstrip()}" for letter, text in OPTION_RE.findall(block)[:4]]
+        
+        if len(options) >= 3:  # Need at least 3 options
+            question = block.strip().split("\n", 1)[0].strip(" *") or f"Question about {topic}"
+            
+            # Pad to 4 options
+            while len(options) < 4:
+                options.append(f"{_OPT_PREFIXES[len(options)]}Option {len(options)+1}")
+            
+            # Extract answer
+            answer_match = ANSWER_RE.search(block)
+            answer = answer_match.group(1).upper() if answer_match else "A"
+            
+            extracted_quizzes.append({
+                "question": question,
+                "options": options,
+                "answer": answer
+            })
     
+    return complete_quiz(extracted_quizzes, topic, level)
+
+def normalize_quizzes(quizzes):
+    """Settle each question's answer and option letters once, at parse time."""
+    for quiz in quizzes:
+        quiz["answer"] = quiz["answer"].strip().upper()[:1]
+        quiz["letters"] = [opt.strip()[:1].upper() for opt in quiz["options"]]
+    return quizzes
+
+def pad_facts(facts, topic):
+    """Trim or top up fun facts to exactly 2."""
+    if len(facts) >= 2:
+        return facts[:2]  # The usual case: nothing to build
+    return facts + [f"Interesting fact about {topic}."] * (2 - len(facts))
+
+def complete_quiz(extracted_quizzes, topic, level):
+    """Trim or top up parsed questions to exactly 3 using the local templates."""
+    return normalize_quizzes(_pad_quiz(extracted_quizzes, topic, level))
+
+def _pad_quiz(extracted_quizzes, topic, level):
     if len(extracted_quizzes) >= 3:
         return extracted_quizzes[:3]
     
     # Strategy 2: Use AI response but ensure we have 3 questions
     if len(extracted_quizzes) > 0:
         # If we have some questions, complete with topic-specific ones
-        while len(extracted_quizzes) < 3:
-            fallback_quiz = generate_topic_specific_quiz(topic, level)
-            for quiz in fallback_quiz:
-                if quiz not in extracted_quizzes and len(extracted_quizzes) < 3:
-                    extracted_quizzes.append(quiz)
-                    break
+        seen = {quiz["question"] for quiz in extracted_quizzes}
+        for quiz in generate_topic_specific_quiz(topic, level):
+            if len(extracted_quizzes) == 3:
+                break
+            if quiz["question"] not in seen:
+                extracted_quizzes.append(quiz)
+                seen.add(quiz["question"])
     
     # Strategy 3: Complete fallback - generate all questions
     if len(extracted_quizzes) < 3:
@@ -348,33 +612,166 @@ def extract_robust_quiz(text, topic, level):
 
 def extract_key_points(explanation):
     """Extract 3-4 concise key takeaways from the lesson text."""
-    sentences = explanation.split('.')
-    points = [s.strip() for s in sentences if len(s.strip()) > 20][:4]
+    # Stops scanning once four points are found instead of splitting the whole text
+    sentences = (m.group(0).strip() for m in SENTENCE_RE.finditer(explanation))
+    points = list(islice((s for s in sentences if len(s) > 20), 4))
     return points or ["Main ideas extracted from explanation."]
 
-@st.cache_data(show_spinner="🔊 Generating audio...")
-def generate_audio(text, language='en'):
-    """Convert text to speech with gTTS."""
+def narration_hash(text):
+    """Short digest of the narration text, so the cache doesn't hash the full text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+# Persisted to disk so narration survives restarts without another gTTS round trip.
+@st.cache_data(persist="disk", max_entries=256, show_spinner=False)
+def cached_audio(text_hash, language, _audio=None):
+    """Cache narration MP3 bytes per (text hash, language) once they are synthesized."""
+    # `_audio` is left out of the cache key: calling without it only serves hits.
+    if _audio is None:
+        raise LookupError(f"No cached narration for {text_hash} ({language})")
+    return _audio
+
+def synthesize_audio(text, language):
+    """Convert text to MP3 bytes with gTTS, one request per sentence in parallel."""
+    # gTTS's MP3 frames concatenate cleanly, so the pieces are simply joined.
+    sentences = [s for s in SENTENCE_END_RE.split(text) if s.strip()] or [text]
+    with ThreadPoolExecutor(max_workers=min(TTS_WORKERS, len(sentences))) as pool:
+        return b"".join(pool.map(lambda s: tts_bytes(s, language), sentences))
+
+@st.cache_resource
+def audio_pool():
+    """Share one background pool for narration jobs across every session."""
+    return ThreadPoolExecutor(max_workers=AUDIO_WORKERS)
+
+def narration_text(lesson):
+    """Text read aloud for a lesson."""
+    return f"{lesson['topic']} lesson. {lesson['explanation']}"
+
+def narration_key(lesson, language):
+    """Identify a lesson's narration, to tell whose audio is sitting in the session."""
+    return (narration_hash(narration_text(lesson)), language)
+
+def request_audio(text, language):
+    """Serve cached narration, or start synthesizing it in the background."""
     if gTTS is None:
-        return None, "gTTS (gtts) package not installed"
+        st.session_state.audio_error = "gTTS (gtts) package not installed"
+        return
+    text_hash = narration_hash(text)
+    try:
+        st.session_state.audio_bytes = cached_audio(text_hash, language)
+    except LookupError:
+        future = audio_pool().submit(synthesize_audio, text, language)
+        st.session_state.audio_job = (future, text_hash, language)
+    else:
+        st.session_state.audio_key = (text_hash, language)
+        st.session_state.audio_job = None  # A job still running for another lesson would overwrite it
 
+def collect_audio():
+    """Move a finished background narration into the cache; False while it is still running."""
+    future, text_hash, language = st.session_state.audio_job
+    if not future.done():
+        return False
+    st.session_state.audio_job = None
     try:
-        tts = gTTS(text=text, lang=language)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-            tts.save(tmp.name)
-            return tmp.name, None
+        # Only successful results reach the cache, so a failed request can be retried
+        st.session_state.audio_bytes = cached_audio(text_hash, language, _audio=future.result())
+        st.session_state.audio_key = (text_hash, language)
     except Exception as e:
-        return None, str(e)
+        st.session_state.audio_error = str(e)
+    return True
+
+def tts_bytes(text, language):
+    """Synthesize one piece of text to MP3 bytes."""
+    buffer = io.BytesIO()
+    gTTS(text=text, lang=language).write_to_fp(buffer)
+    return buffer.getvalue()
+
+# ---------- History Helpers ----------
+# Each lesson dict is stored once in `lessons`; the history order and the
+# current lesson only hold its (topic, level) key.
+def history_key(lesson):
+    """Key a lesson by its topic and level, ignoring case and stray whitespace."""
+    return (topic_key(lesson["topic"]), lesson["level"])
+
+def track_lesson(lesson, step):
+    """Add (step=1) or remove (step=-1) a lesson from the running history stats."""
+    stats = st.session_state.history_stats
+    topic = topic_key(lesson["topic"])  # "DNA" and "dna" count as one topic
+    stats["topics"][topic] += step
+    if stats["topics"][topic] <= 0:
+        del stats["topics"][topic]
+    stats["ai_generated"] += step * bool(lesson.get("ai_generated", True))
+
+def store_lesson(key, lesson):
+    """Put a lesson in the store, replacing any lesson already held under its key."""
+    old = st.session_state.lessons.get(key)
+    if old is not None:
+        track_lesson(old, -1)
+    st.session_state.lessons[key] = lesson
+    track_lesson(lesson, 1)
+
+def remember_lesson(lesson):
+    """Store a lesson once and move its key to the end of the history."""
+    key = history_key(lesson)
+    history = st.session_state.history_keys
+    if key in st.session_state.lessons:
+        history.remove(key)
+    elif len(history) == history.maxlen:
+        track_lesson(st.session_state.lessons.pop(history.popleft()), -1)
+    store_lesson(key, lesson)
+    history.append(key)
+    return key
+
+def forget_lesson(key):
+    """Drop a lesson from the store and the history."""
+    lesson = st.session_state.lessons.pop(key, None)
+    if lesson is not None:
+        track_lesson(lesson, -1)
+    if key in st.session_state.history_keys:
+        st.session_state.history_keys.remove(key)
+
+def reset_history():
+    """Empty the lesson store, the history and its stats."""
+    st.session_state.lessons = {}
+    st.session_state.history_keys = deque(maxlen=HISTORY_LIMIT)
+    # Kept up to date on every change so the history panel doesn't rescan all lessons
+    st.session_state.history_stats = {"topics": Counter(), "ai_generated": 0}
+
+def history_lessons():
+    """Return stored lessons in history order, oldest first."""
+    return [st.session_state.lessons[key] for key in st.session_state.history_keys]
 
 # ---------- Session State ----------
-if "history" not in st.session_state:
-    st.session_state.history = load_history_from_file()
-if "current_lesson" not in st.session_state:
-    st.session_state.current_lesson = None
+if "lessons" not in st.session_state:
+    reset_history()
+    saved_lessons, needs_compaction = load_history_from_file()
+    latest = {}
+    for saved_lesson in saved_lessons:
+        if "timestamp_display" not in saved_lesson:
+            # Saved before display strings were stored; format them once here, and the
+            # compaction below writes them back so this only happens for one session.
+            saved_lesson.update(lesson_timestamps(datetime.fromisoformat(saved_lesson["timestamp"])))
+            needs_compaction = True
+        key = history_key(saved_lesson)
+        latest.pop(key, None)  # A repeat moves to where it was last saved
+        latest[key] = saved_lesson
+    for saved_lesson in latest.values():
+        remember_lesson(saved_lesson)  # Keeps only the latest HISTORY_LIMIT in the session
+    # Only rewrite the log when replaying it dropped repeats or a truncated line, so a page
+    # load doesn't clobber other sessions' appends; lessons beyond HISTORY_LIMIT stay on disk.
+    if needs_compaction or len(latest) != len(saved_lessons):
+        save_history_to_file(latest.values())
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
+if "current_key" not in st.session_state:
+    st.session_state.current_key = None
 if "quiz_answers" not in st.session_state:
     st.session_state.quiz_answers = {}
-if "audio_file" not in st.session_state:
-    st.session_state.audio_file = None
+if "audio_bytes" not in st.session_state:
+    st.session_state.audio_bytes = None
+    st.session_state.audio_key = None  # narration_key() of audio_bytes, so it only plays for its lesson
+if "audio_job" not in st.session_state:
+    st.session_state.audio_job = None  # (future, text hash, language) while narration is synthesized
+    st.session_state.audio_error = None
 if "quiz_results" not in st.session_state:
     st.session_state.quiz_results = {}
 if "current_quiz_score" not in st.session_state:
@@ -387,24 +784,23 @@ MODEL, status = init_gemini()
 with st.sidebar:
     st.header("🎯 Learning Control Panel")
     st.markdown(f"**AI Engine:** {status}")
-    st.metric("Lessons Stored", len(st.session_state.history))
+    st.metric("Lessons Stored", len(st.session_state.history_keys))
 
     audio_language = st.selectbox("🎧 Audio Language", ["en", "es", "fr", "de"], index=0)
 
     st.markdown("---")
     # Polished Button 1
     if st.button("💾 Persist Session Data"):
-        if save_history_to_file(st.session_state.history):
+        if compact_history():
             st.success("✅ History saved successfully!")
     # Polished Button 2
     if st.button("📤 Export History JSON"):
         try:
-            with open(HISTORY_FILE, "rb") as f:
-                st.download_button("⬇️ Download JSON", data=f, file_name="my_lessons.json")
+            st.download_button("⬇️ Download JSON", data=json.dumps(history_lessons(), indent=2), file_name="my_lessons.json")
         except Exception as e:
             st.error(f"Export failed: {e}")
     if st.button("🧹 Clear All History"):
-        st.session_state.history = []
+        reset_history()
         st.session_state.current_quiz_score = {"correct": 0, "total": 0, "answers": {}}
         save_history_to_file([])
         st.success("Session cleared.")
@@ -412,29 +808,219 @@ with st.sidebar:
 
 # ---------- Main Interface ----------
 st.divider()
-topic = st.text_input("🎓 Enter a science topic", placeholder="e.g., Photosynthesis")
+# Stripped so whitespace-only input is rejected and "Photosynthesis " shares a cache entry
+topic = st.text_input("🎓 Enter a science topic", placeholder="e.g., Photosynthesis").strip()
 level = st.selectbox("📘 Select Level", ["Beginner", "Intermediate", "Advanced"])
 if st.button("✨ Generate Lesson"):
     if not MODEL:
         st.error("❌ AI not ready. Check API key.")
     elif topic:
         with st.spinner(f"Generating lesson on {topic}..."):
-            data = generate_explanation(topic, level)
+            stream_area = st.empty()
+            data = fetch_lesson(topic, level, stream_area)
+            stream_area.empty()
             if "error" in data:
                 st.error(data["error"])
             else:
-                st.session_state.current_lesson = data
-                st.session_state.history.append(data)
+                st.session_state.current_key = remember_lesson(data)
                 st.session_state.current_quiz_score = {"correct": 0, "total": 0, "answers": {}}
-                save_history_to_file(st.session_state.history)
+                append_history_record(data)
+                # Start narrating right away so the audio is usually ready by the time it's wanted
+                if gTTS is not None:
+                    request_audio(narration_text(data), audio_language)
                 st.success(f"✅ Lesson on {topic} ready! (Quiz guaranteed)")
                 st.balloons()
     else:
         st.warning("Enter a topic first!")
 
+# ---------- Lesson Tabs ----------
+# Fragments: answering the quiz or generating audio reruns only that tab, not the whole page.
+# Quiz and paging state changes in widget callbacks, which run before the fragment
+# redraws, so no explicit rerun is needed; st.rerun(scope="fragment") fails whenever
+# Streamlit folds the click into a full-app rerun (e.g. one queued by audio_progress).
+def submit_quiz(lesson, lesson_key):
+    """Grade the submitted quiz form."""
+    quiz_data = st.session_state.quiz_results[lesson_key]
+    choices = [st.session_state[f"quiz_{lesson_key}_{i}"] for i in range(1, len(lesson["quizzes"]) + 1)]
+    # Kept until the next submit, so a rerun queued meanwhile doesn't swallow the warning
+    quiz_data["incomplete"] = None in choices
+    if quiz_data["incomplete"]:
+        return
+    for i, (q, choice) in enumerate(zip(lesson["quizzes"], choices), 1):
+        # Lessons saved before letters were precomputed derive them here
+        letters = q.get("letters") or [opt.strip()[:1].upper() for opt in q["options"]]
+        user_letter = letters[choice]
+        is_correct = user_letter == q["answer"]
+        
+        # Store the answer
+        quiz_data["answers"][f"q_{i}"] = {
+            "selected": user_letter,  # Store just the letter (A, B, C, D)
+            "index": choice,
+            "is_correct": is_correct,
+            "correct_answer": q["answer"]
+        }
+        
+        # Update current quiz score
+        st.session_state.current_quiz_score["total"] += 1
+        if is_correct:
+            st.session_state.current_quiz_score["correct"] += 1
+
+def retake_quiz(lesson_key):
+    """Clear a lesson's answers so its quiz can be taken again."""
+    del st.session_state.quiz_results[lesson_key]
+    st.session_state.current_quiz_score = {"correct": 0, "total": 0, "answers": {}}
+
+@st.fragment
+def quiz_tab(lesson):
+    """Render the interactive quiz with real-time scoring."""
+    st.markdown("### 🧩 Test Your Knowledge")
+    st.markdown(f"Answer these questions about **{lesson['topic']}**:")
+    
+    # Initialize quiz session for this lesson if not exists; a short digest keeps
+    # the per-widget keys below compact whatever the topic text is.
+    lesson_key = hashlib.blake2b(f"{lesson['topic']}_{lesson['timestamp']}".encode("utf-8"), digest_size=6).hexdigest()
+    quiz_data = st.session_state.quiz_results.setdefault(lesson_key, {
+        "answers": {},
+        "submitted": False
+    })
+    
+    # Display current score progress
+    if quiz_data["answers"]:
+        correct_answers = sum(1 for answer in quiz_data["answers"].values() if answer["is_correct"])
+        total_answered = len(quiz_data["answers"])
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Current Score", f"{correct_answers}/{total_answered}")
+        with col2:
+            if total_answered > 0:
+                percentage = (correct_answers / total_answered) * 100
+                st.metric("Percentage", f"{percentage:.0f}%")
+            else:
+                st.metric("Percentage", "0%")
+        with col3:
+            st.metric("Questions Left", f"{len(lesson['quizzes']) - total_answered}")
+    
+    # Display each question; unanswered ones go in one form so the whole quiz
+    # is submitted with a single rerun instead of one per question.
+    if len(quiz_data["answers"]) < len(lesson["quizzes"]):
+        with st.form(f"quiz_form_{lesson_key}"):
+            choices = []
+            for i, q in enumerate(lesson["quizzes"], 1):
+                st.markdown(f"**Question {i}:** {q['question']}")
+                # Radio values are option positions, so no string lookup is needed to grade
+                choices.append(st.radio(
+                    "Select your answer:",
+                    range(len(q["options"])),
+                    format_func=q["options"].__getitem__,
+                    key=f"quiz_{lesson_key}_{i}",
+                    index=None,
+                    label_visibility="hidden"
+                ))
+                st.divider()
+            st.form_submit_button("✅ Submit All Answers", on_click=submit_quiz, args=(lesson, lesson_key))
+        
+        if quiz_data.get("incomplete"):
+            st.warning("Answer every question before submitting.")
+    else:
+        for i, q in enumerate(lesson["quizzes"], 1):
+            st.markdown(f"**Question {i}:** {q['question']}")
+            answer_data = quiz_data["answers"][f"q_{i}"]
+            st.radio(
+                "Your answer:",
+                q["options"],
+                key=f"quiz_{lesson_key}_{i}_answered",
+                index=answer_data["index"],
+                disabled=True,
+                label_visibility="hidden"
+            )
+            if answer_data["is_correct"]:
+                st.success("🎉 **Correct!** Well done!")
+            else:
+                st.error(f"❌ **Not quite right.** The correct answer is: **{q['answer']}**")
+            st.info(f"💡 **Explanation:** This question tests your understanding of key concepts in {lesson['topic']}.")
+            st.divider()
+    
+    # Final quiz summary
+    if quiz_data["answers"] and len(quiz_data["answers"]) == len(lesson["quizzes"]):
+        correct_answers = sum(1 for answer in quiz_data["answers"].values() if answer["is_correct"])
+        total_questions = len(lesson["quizzes"])
+        percentage = (correct_answers / total_questions) * 100
+        
+        st.markdown("### 🏆 Quiz Complete!")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Final Score", f"{correct_answers}/{total_questions}")
+        with col2:
+            st.metric("Final Percentage", f"{percentage:.0f}%")
+        with col3:
+            if percentage >= 80:
+                st.success("🏆 Excellent!")
+            elif percentage >= 60:
+                st.info("👍 Good work!")
+            else:
+                st.warning("📚 Keep learning!")
+        
+        # Detailed breakdown
+        st.markdown("#### 📊 Answer Breakdown:")
+        for i, q in enumerate(lesson["quizzes"], 1):
+            question_key = f"q_{i}"
+            answer_data = quiz_data["answers"][question_key]
+            status = "✅" if answer_data["is_correct"] else "❌"
+            st.write(f"{status} **Question {i}:** Your answer: {answer_data['selected']} | Correct answer: {q['answer']}")
+        
+        # Reset quiz button
+        st.button("🔄 Retake Quiz", on_click=retake_quiz, args=(lesson_key,))
+
+@st.fragment
+def audio_tab(lesson, language):
+    """Render the narration player and its controls."""
+    st.markdown("### 🔊 Listen to Your Lesson")
+    
+    if st.session_state.audio_error:
+        st.error(st.session_state.audio_error)
+        st.session_state.audio_error = None
+    
+    # The session holds one narration; it may belong to a lesson viewed or generated earlier
+    current = narration_key(lesson, language)
+    audio = st.session_state.audio_bytes if st.session_state.audio_key == current else None
+    job = st.session_state.audio_job
+    pending = job is not None and job[1:] == current
+    
+    if audio:
+        st.success("✅ Audio ready!")
+        st.audio(audio, format="audio/mpeg")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔄 New Audio", disabled=pending):
+                request_audio(narration_text(lesson), language)
+                st.rerun()  # Full rerun so the progress poller starts
+        with col2:
+            st.download_button(
+                "💾 Download",
+                data=audio,
+                file_name=f"{lesson['topic']}_lesson.mp3",
+                mime="audio/mpeg"
+            )
+    elif not pending:
+        # Polished Button 3
+        if st.button("🔊 Synthesize Narration"):
+            request_audio(narration_text(lesson), language)
+            st.rerun()  # Full rerun so the progress poller starts
+
+@st.fragment(run_every=AUDIO_POLL_SECONDS)
+def audio_progress(current):
+    """Poll the background narration job, leaving the rest of the page usable meanwhile."""
+    if collect_audio():
+        st.rerun()  # Redraw the audio tab with the result and stop polling
+    if st.session_state.audio_job[1:] == current:
+        st.info("⏳ Creating audio narration in the background...")
+
 # ---------- Display Lesson ----------
-if st.session_state.current_lesson:
-    lesson = st.session_state.current_lesson
+lesson = st.session_state.lessons.get(st.session_state.current_key)
+if lesson:
     
     # Lesson header with generation status
     col1, col2 = st.columns([3, 1])
@@ -447,9 +1033,9 @@ if st.session_state.current_lesson:
     with col2:
         if st.button("🔄 Regenerate"):
             with st.spinner("Creating new lesson..."):
-                new_lesson = generate_explanation(lesson['topic'], lesson['level'])
-                st.session_state.current_lesson = new_lesson
-                st.session_state.history[-1] = new_lesson
+                new_lesson = fetch_lesson(lesson['topic'], lesson['level'])
+                # Same (topic, level) key, so this replaces the lesson in place
+                store_lesson(st.session_state.current_key, new_lesson)
                 st.session_state.current_quiz_score = {"correct": 0, "total": 0, "answers": {}}
                 st.rerun()
 
@@ -458,10 +1044,11 @@ if st.session_state.current_lesson:
     # Explanation Tab
     with tab1:
         st.markdown(lesson["explanation"])
-        st.caption(f"📊 {lesson['word_count']} words • Generated {datetime.fromisoformat(lesson['timestamp']).strftime('%H:%M %p')}")
+        st.caption(f"📊 {lesson['word_count']} words • Generated {lesson['timestamp_hm']}")
         
         st.markdown("### 💡 Key Takeaways")
-        for pt in extract_key_points(lesson["explanation"]):
+        # Lessons saved before key points were stored derive them here
+        for pt in lesson.get("key_points") or extract_key_points(lesson["explanation"]):
             st.markdown(f"- {pt}")
 
     # Fun Facts Tab
@@ -475,221 +1062,89 @@ if st.session_state.current_lesson:
 
     # Quiz Tab - Enhanced with real-time scoring
     with tab3:
-        st.markdown("### 🧩 Test Your Knowledge")
-        st.markdown(f"Answer these questions about **{lesson['topic']}**:")
-        
-        # Initialize quiz session for this lesson if not exists
-        lesson_key = f"{lesson['topic']}_{lesson['timestamp']}"
-        if lesson_key not in st.session_state.quiz_results:
-            st.session_state.quiz_results[lesson_key] = {
-                "answers": {},
-                "submitted": False
-            }
-        
-        quiz_data = st.session_state.quiz_results[lesson_key]
-        
-        # Display current score progress
-        if quiz_data["answers"]:
-            correct_answers = sum(1 for answer in quiz_data["answers"].values() if answer["is_correct"])
-            total_answered = len(quiz_data["answers"])
-            
+        quiz_tab(lesson)
+
+    # Audio Tab
+    with tab4:
+        audio_tab(lesson, audio_language)
+        if st.session_state.audio_job is not None:
+            audio_progress(narration_key(lesson, audio_language))
+
+# ---------- Enhanced History Section ----------
+# Viewing or deleting still reruns the page; paging through the history only reruns the panel.
+def set_history_page(page):
+    """Move the history panel to another page."""
+    st.session_state.history_page = page
+
+@st.fragment
+def history_panel():
+    """Render saved lessons with their stats and per-lesson actions."""
+    with st.expander("📚 Complete Lesson History", expanded=False):
+        history = st.session_state.history_keys
+        if history:
+            # History statistics
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Current Score", f"{correct_answers}/{total_answered}")
+                st.metric("Total Lessons", len(history))
+            stats = st.session_state.history_stats
             with col2:
-                if total_answered > 0:
-                    percentage = (correct_answers / total_answered) * 100
-                    st.metric("Percentage", f"{percentage:.0f}%")
-                else:
-                    st.metric("Percentage", "0%")
+                st.metric("Unique Topics", len(stats["topics"]))
             with col3:
-                st.metric("Questions Left", f"{len(lesson['quizzes']) - total_answered}")
-        
-        # Display each question
-        for i, q in enumerate(lesson["quizzes"], 1):
-            st.markdown(f"**Question {i}:** {q['question']}")
+                st.metric("AI Generated", f"{stats['ai_generated']}/{len(history)}")
             
-            # Check if this question has been answered
-            question_key = f"q_{i}"
-            is_answered = question_key in quiz_data["answers"]
+            st.markdown("---")
             
-            # Create radio button for answer selection
-            selected_answer = st.radio(
-                "Select your answer:",
-                q["options"],
-                key=f"quiz_{lesson_key}_{i}",
-                index=None if not is_answered else next((idx for idx, opt in enumerate(q["options"]) if opt.startswith(quiz_data["answers"][question_key]["selected"])), None),
-                disabled=is_answered,
-                label_visibility="hidden"
-            )
-            
-            # Answer submission
-            col1, col2 = st.columns([1, 4])
-            with col1:
-                if not is_answered and selected_answer:
-                    if st.button(f"✅ Submit Answer {i}", key=f"submit_{i}"):
-                        # Check if answer is correct
-                        is_correct = selected_answer.startswith(q["answer"])
-                        
-                        # Store the answer
-                        quiz_data["answers"][question_key] = {
-                            "selected": selected_answer[0],  # Store just the letter (A, B, C, D)
-                            "is_correct": is_correct,
-                            "correct_answer": q["answer"]
-                        }
-                        
-                        # Update current quiz score
-                        st.session_state.current_quiz_score["total"] += 1
-                        if is_correct:
-                            st.session_state.current_quiz_score["correct"] += 1
+            # Display one page of lessons, newest first; only that page's lessons are looked up
+            pages = -(-len(history) // HISTORY_PAGE)
+            page = min(st.session_state.history_page, pages - 1)  # Deletes can shrink the last page away
+            start = page * HISTORY_PAGE
+            for i, key in enumerate(islice(reversed(history), start, start + HISTORY_PAGE), start + 1):
+                lesson = st.session_state.lessons[key]
+                with st.container():
+                    col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+                    
+                    with col1:
+                        st.markdown(f"**{i}. {lesson['topic']}** ({lesson['level']})")
                         
-                        st.success("✅ Answer submitted!")
-                        st.rerun()
-            
-            with col2:
-                if is_answered:
-                    answer_data = quiz_data["answers"][question_key]
-                    if answer_data["is_correct"]:
-                        st.success("🎉 **Correct!** Well done!")
-                    else:
-                        st.error(f"❌ **Not quite right.** The correct answer is: **{q['answer']}**")
-                    st.info(f"💡 **Explanation:** This question tests your understanding of key concepts in {lesson['topic']}.")
-            
-            st.divider()
-        
-        # Final quiz summary
-        if quiz_data["answers"] and len(quiz_data["answers"]) == len(lesson["quizzes"]):
-            correct_answers = sum(1 for answer in quiz_data["answers"].values() if answer["is_correct"])
-            total_questions = len(lesson["quizzes"])
-            percentage = (correct_answers / total_questions) * 100
-            
-            st.markdown("### 🏆 Quiz Complete!")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Final Score", f"{correct_answers}/{total_questions}")
-            with col2:
-                st.metric("Final Percentage", f"{percentage:.0f}%")
-            with col3:
-                if percentage >= 80:
-                    st.success("🏆 Excellent!")
-                elif percentage >= 60:
-                    st.info("👍 Good work!")
-                else:
-                    st.warning("📚 Keep learning!")
-            
-            # Detailed breakdown
-            st.markdown("#### 📊 Answer Breakdown:")
-            for i, q in enumerate(lesson["quizzes"], 1):
-                question_key = f"q_{i}"
-                answer_data = quiz_data["answers"][question_key]
-                status = "✅" if answer_data["is_correct"] else "❌"
-                st.write(f"{status} **Question {i}:** Your answer: {answer_data['selected']} | Correct answer: {q['answer']}")
-            
-            # Reset quiz button
-            if st.button("🔄 Retake Quiz"):
-                del st.session_state.quiz_results[lesson_key]
-                st.session_state.current_quiz_score = {"correct": 0, "total": 0, "answers": {}}
-                st.rerun()
-
-    # Audio Tab
-    with tab4:
-        st.markdown("### 🔊 Listen to Your Lesson")
-        
-        if st.session_state.audio_file:
-            st.success("✅ Audio ready!")
-            st.audio(st.session_state.audio_file)
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("🔄 New Audio"):
-                    with st.spinner("Generating new audio..."):
-                        audio, err = generate_audio(f"{lesson['topic']} lesson. {lesson['explanation']}", language=audio_language)
-                        if err:
-                            st.error(err)
+                        # Polished Warning Message
+                        if len(lesson.get('quizzes', [])) >= 3:
+                            st.success("✅ Complete quiz")
                         else:
-                            st.session_state.audio_file = audio
-                            st.success("Audio updated!")
+                            st.warning("⚠️ Quiz structure incomplete")
+                        
+                        # Timestamp
+                        st.caption(f"📅 {lesson['timestamp_display']}")
+                    
+                    with col2:
+                        if st.button("👁️ View", key=f"view_{i}"):
+                            st.session_state.current_key = key
+                            st.rerun()
+                    
+                    with col3:
+                        if st.button("🗑️ Delete", key=f"delete_{i}"):
+                            forget_lesson(key)
+                            compact_history(drop={key})
+                            st.success("Lesson deleted")
                             st.rerun()
-            with col2:
-                if st.button("💾 Download"):
-                    try:
-                        with open(st.session_state.audio_file, 'rb') as f:
-                            audio_bytes = f.read()
-                            st.download_button(
-                                "📱 Save Audio",
-                                data=audio_bytes,
-                                file_name=f"{lesson['topic']}_lesson.mp3",
-                                mime="audio/mpeg"
-                            )
-                    except Exception as e:
-                        st.error(f"Download failed: {e}")
-        else:
-            # Polished Button 3
-            if st.button("🔊 Synthesize Narration"):
-                with st.spinner("Creating audio narration..."):
-                    audio, err = generate_audio(f"{lesson['topic']} lesson. {lesson['explanation']}", language=audio_language)
-                    if err:
-                        st.error(err)
-                    else:
-                        st.session_state.audio_file = audio
-                        st.success("Audio ready!")
-                        st.rerun()
-
-# ---------- Enhanced History Section ----------
-with st.expander("📚 Complete Lesson History", expanded=False):
-    if st.session_state.history:
-        # History statistics
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Total Lessons", len(st.session_state.history))
-        with col2:
-            topics = [h['topic'] for h in st.session_state.history]
-            unique_topics = len(set(topics))
-            st.metric("Unique Topics", unique_topics)
-        with col3:
-            ai_generated = sum(1 for h in st.session_state.history if h.get('ai_generated', True))
-            st.metric("AI Generated", f"{ai_generated}/{len(st.session_state.history)}")
-        
-        st.markdown("---")
-        
-        # Display lessons
-        for i, lesson in enumerate(reversed(st.session_state.history), 1):
-            with st.container():
-                col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
-                
-                with col1:
-                    st.markdown(f"**{i}. {lesson['topic']}** ({lesson['level']})")
                     
-                    # Polished Warning Message
-                    if len(lesson.get('quizzes', [])) >= 3:
-                        st.success("✅ Complete quiz")
-                    else:
-                        st.warning("⚠️ Quiz structure incomplete")
+                    with col4:
+                        word_count = lesson.get('word_count', 0)
+                        st.caption(f"📝 {word_count} words")
                     
-                    # Timestamp
-                    timestamp = datetime.fromisoformat(lesson['timestamp'])
-                    st.caption(f"📅 {timestamp.strftime('%b %d, %Y at %I:%M %p')}")
-                
+                    st.divider()
+            
+            if pages > 1:
+                col1, col2, col3 = st.columns([1, 2, 1])
+                with col1:
+                    st.button("⬅️ Newer", disabled=page == 0, on_click=set_history_page, args=(page - 1,))
                 with col2:
-                    if st.button("👁️ View", key=f"view_{i}"):
-                        st.session_state.current_lesson = lesson
-                        st.rerun()
-                
+                    st.caption(f"📜 Page {page + 1} of {pages}")
                 with col3:
-                    if st.button("🗑️ Delete", key=f"delete_{i}"):
-                        st.session_state.history.remove(lesson)
-                        save_history_to_file(st.session_state.history)
-                        st.success("Lesson deleted")
-                        st.rerun()
-                
-                with col4:
-                    word_count = lesson.get('word_count', 0)
-                    st.caption(f"📝 {word_count} words")
-                
-                st.divider()
-    else:
-        st.info("📚 No lessons saved yet. Generate your first lesson to get started!")
+                    st.button("Older ➡️", disabled=page == pages - 1, on_click=set_history_page, args=(page + 1,))
+        else:
+            st.info("📚 No lessons saved yet. Generate your first lesson to get started!")
+
+history_panel()
 
 # ---------- Footer ----------
 st.markdown("---")
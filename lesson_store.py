@@ -0,0 +1,52 @@
+"""SQLite store of raw Gemini lesson responses that survives app restarts.
+
+Keyed by a hash of the normalized (topic, level) and the prompt version, so a
+prompt change invalidates every entry at once. Filled by the app after each
+live generation and offline by scripts/prewarm.py.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from prompts import PROMPT_VERSION
+
+STORE_FILE = os.getenv("LESSON_STORE_FILE", "lesson_cache.db")
+STORE_TTL = 7 * 24 * 3600  # seconds a stored response stays valid
+
+
+def lesson_key(topic, level):
+    """Hash a normalized (topic, level) pair and the prompt version into the store key."""
+    raw = f"{topic.strip().lower()}|{level}|{PROMPT_VERSION}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    conn = sqlite3.connect(STORE_FILE)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS lessons ("
+        "key TEXT PRIMARY KEY, topic TEXT, level TEXT, response TEXT, created REAL)"
+    )
+    return conn
+
+
+def get_response(topic, level):
+    """Return the stored response text for (topic, level), or None if missing or expired."""
+    if not os.path.exists(STORE_FILE):
+        return None
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT response FROM lessons WHERE key = ? AND created > ?",
+            (lesson_key(topic, level), time.time() - STORE_TTL),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def put_responses(items):
+    """Store an iterable of (topic, level, response_text) tuples."""
+    now = time.time()
+    rows = [(lesson_key(t, l), t, l, text, now) for t, l, text in items]
+    with closing(_connect()) as conn, conn:
+        conn.executemany("INSERT OR REPLACE INTO lessons VALUES (?, ?, ?, ?, ?)", rows)
+    return len(rows)
@@ -0,0 +1,55 @@
+"""Prompt templates shared by the Streamlit app and offline scripts."""
+
+# Bump whenever the prompt changes so stored lessons from the old prompt are ignored.
+PROMPT_VERSION = 4
+
+# Static instructions sent as the system instruction; only the short per-lesson
+# message below changes per call.
+# The response layout is enforced by LESSON_SCHEMA, so it isn't spelled out here.
+TEACHER_SYSTEM = (
+    "You are a patient science teacher. Return JSON matching the schema: "
+    "explanation (200-300 words in the given style, with one relatable example), "
+    "fun_facts (2 strings), quizzes (3 objects: question, options labeled \"A) \" "
+    "to \"D) \", answer letter). Make the three questions cover distinct sub-concepts."
+)
+
+# JSON schema for Gemini's structured output mode.
+LESSON_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "explanation": {"type": "STRING"},
+        "fun_facts": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "quizzes": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "question": {"type": "STRING"},
+                    "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+                    "answer": {"type": "STRING", "enum": ["A", "B", "C", "D"]}
+                },
+                "required": ["question", "options", "answer"]
+            }
+        }
+    },
+    "required": ["explanation", "fun_facts", "quizzes"]
+}
+
+LESSON_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": LESSON_SCHEMA
+}
+
+LEVEL_CONTEXTS = {
+    "Beginner": "simple language, basic concepts, everyday examples",
+    "Intermediate": "moderate complexity, scientific terminology, practical applications",
+    "Advanced": "detailed explanations, complex concepts, technical precision"
+}
+
+PROMPT_TEMPLATE = "Topic: {topic}. Level: {level}. Style: {context}."
+
+
+def build_prompt(topic, level):
+    """Build the per-lesson message sent after TEACHER_SYSTEM."""
+    context = LEVEL_CONTEXTS.get(level, LEVEL_CONTEXTS["Beginner"])
+    return PROMPT_TEMPLATE.format(topic=topic, level=level, context=context)
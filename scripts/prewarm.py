@@ -0,0 +1,130 @@
+"""Pre-generate lessons for (topic, level) pairs through the Gemini Batch API.
+
+Batch requests are billed at half the interactive rate and are not subject to
+the per-minute request limits, so seeding popular topics offline is cheaper
+than letting the first visitors trigger live calls. Results land in the
+lesson store the app reads before calling Gemini.
+
+Usage:
+    pip install -r scripts/requirements.txt
+    python scripts/prewarm.py topics.txt [--levels Beginner Intermediate]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from dotenv import load_dotenv
+except Exception:
+    def load_dotenv(*args, **kwargs):
+        return False
+
+try:
+    from google import genai
+except Exception:
+    genai = None
+
+import lesson_store
+from prompts import LESSON_GENERATION_CONFIG, TEACHER_SYSTEM, build_prompt
+
+MODEL_NAME = "models/gemini-2.0-flash"
+LEVELS = ["Beginner", "Intermediate", "Advanced"]
+DONE_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_PARTIALLY_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+
+def write_batch_file(pairs, path):
+    """Write one Batch API request line per (topic, level) pair."""
+    with open(path, "w", encoding="utf-8") as f:
+        for topic, level in pairs:
+            line = {
+                "key": f"{topic}|{level}",
+                "request": {
+                    "system_instruction": {"parts": [{"text": TEACHER_SYSTEM}]},
+                    "contents": [{"parts": [{"text": build_prompt(topic, level)}]}],
+                    "generation_config": LESSON_GENERATION_CONFIG,
+                },
+            }
+            f.write(json.dumps(line) + "\n")
+
+
+def parse_results(raw):
+    """Yield (topic, level, text) for every successful line of a batch result file."""
+    for line in raw.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        topic, _, level = record.get("key", "").rpartition("|")
+        try:
+            text = record["response"]["candidates"][0]["content"]["parts"][0]["text"]
+        except (KeyError, IndexError):
+            print(f"Skipping {record.get('key')}: {record.get('error', 'no text in response')}")
+            continue
+        yield topic, level, text
+
+
+def run_batch(client, pairs, poll_seconds=30):
+    """Submit the batch, wait for it to finish and return the result file bytes."""
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as tmp:
+        batch_path = tmp.name
+    try:
+        write_batch_file(pairs, batch_path)
+        uploaded = client.files.upload(
+            file=batch_path,
+            config={"display_name": "lesson-prewarm", "mime_type": "jsonl"},
+        )
+    finally:
+        os.unlink(batch_path)
+
+    job = client.batches.create(
+        model=MODEL_NAME, src=uploaded.name, config={"display_name": "lesson-prewarm"}
+    )
+    print(f"Submitted {job.name} with {len(pairs)} requests")
+    while job.state.name not in DONE_STATES:
+        time.sleep(poll_seconds)
+        job = client.batches.get(name=job.name)
+        print(f"  {job.state.name}")
+
+    if job.state.name not in ("JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"):
+        raise RuntimeError(f"Batch job ended in {job.state.name}: {job.error}")
+    return client.files.download(file=job.dest.file_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("topics_file", help="text file with one topic per line")
+    parser.add_argument("--levels", nargs="+", default=LEVELS, choices=LEVELS)
+    parser.add_argument("--poll-seconds", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    if genai is None:
+        sys.exit("❌ google-genai package not installed (pip install -r scripts/requirements.txt)")
+    load_dotenv()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        sys.exit("❌ Missing GOOGLE_API_KEY in .env")
+
+    with open(args.topics_file, encoding="utf-8") as f:
+        topics = [line.strip() for line in f if line.strip()]
+    pairs = [(topic, level) for topic in topics for level in args.levels]
+    if not pairs:
+        sys.exit("No topics to pre-generate.")
+
+    client = genai.Client(api_key=api_key)
+    raw = run_batch(client, pairs, args.poll_seconds)
+    stored = lesson_store.put_responses(parse_results(raw))
+    print(f"✅ Stored {stored}/{len(pairs)} lessons in {lesson_store.STORE_FILE}")
+
+
+if __name__ == "__main__":
+    main()